@@ -1,41 +1,236 @@
 # dbmanager.py
 import os
+import base64
 import json
+import logging
+import mmap
+import queue
 import sqlite3
-import datetime
-import secrets
-import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 
+# Prefer orjson (C encoder/decoder); fall back to stdlib json if unavailable
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 DB_JSON = "datasets.json"
 DB_SQLITE = "datasets.db"
+_TS_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+# parsed datasets.json (+ id -> list position and pre-serialized responses), reused until the
+# file's (inode, mtime, size) changes; os.replace swaps the inode even within one mtime tick
+_JSON_CACHE = {"stat": None, "data": None, "index": {}, "raw_bytes": None, "latest": {}}
+_JSON_LOCK = threading.RLock()
+# SQLite needs a full resync from datasets.json; tracked apart from the JSON cache key so a
+# later write_json can't clear it, and retried with exponential backoff while it keeps failing
+_SYNC_BACKOFF_MIN = 1.0
+_SYNC_BACKOFF_MAX = 60.0
+_SQLITE_SYNC = {"stale": False, "retry_at": 0.0, "delay": _SYNC_BACKOFF_MIN}
+# files at least this big are parsed straight from an mmap instead of read() into a copy
+_MMAP_MIN_SIZE = 64 * 1024
+
+# one shared SQLite connection for writes, serialized by _DB_LOCK; every thread reads through
+# its own query_only connection, so under WAL readers run alongside the writer and only
+# ever see committed data
+_CONN: Optional[sqlite3.Connection] = None
+_DB_LOCK = threading.RLock()
+_READ_LOCAL = threading.local()
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+_READ_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+_FTS_ENABLED = False
+
+# Hot-path SQL, kept as constants so the connection's statement cache reuses the compiled statements
+SQL_VALIDATE = "SELECT active FROM api_keys WHERE key = ?"
+SQL_LOG_USAGE = "INSERT INTO usage_logs (api_key, endpoint, ts) VALUES (?, ?, ?)"
+SQL_SEARCH = (
+    "SELECT d.id,d.name,d.url,d.updated,d.rows,d.columns,d.description,d.tags FROM datasets_fts f "
+    "JOIN datasets d ON d.rowid = f.rowid WHERE datasets_fts MATCH ? ORDER BY f.rank LIMIT ?"
+)
+SQL_SEARCH_LIKE = (
+    "SELECT id,name,url,updated,rows,columns,description,tags FROM datasets "
+    "WHERE name LIKE ? OR description LIKE ? OR tags LIKE ? LIMIT ?"
+)
+SQL_CREATE_KEY = "INSERT INTO api_keys (key, label, created_at, active, quota) VALUES (?, ?, ?, ?, ?)"
+SQL_DEACTIVATE_KEY = "UPDATE api_keys SET active = 0 WHERE key = ?"
+SQL_DELETE_DATASET = "DELETE FROM datasets WHERE id = ?"
+SQL_DELETE_TAGS = "DELETE FROM dataset_tags WHERE dataset_id = ?"
+SQL_INSERT_TAG = "INSERT OR IGNORE INTO dataset_tags (dataset_id, tag) VALUES (?, ?)"
+SQL_GET_BY_ID = "SELECT id,name,url,updated,rows,columns,description,tags FROM datasets WHERE id = ?"
+SQL_LATEST = "SELECT id,name,url,updated,rows,columns,description,tags FROM datasets ORDER BY updated DESC LIMIT ?"
+SQL_STATS = "SELECT COUNT(*), MAX(updated) FROM datasets"
+SQL_TAG_COUNTS = "SELECT tag, COUNT(*) FROM dataset_tags GROUP BY tag"
+SQL_UPSERT_DATASET = """
+    INSERT INTO datasets (id, name, url, updated, rows, columns, description, tags)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        name=excluded.name,
+        url=excluded.url,
+        updated=excluded.updated,
+        rows=excluded.rows,
+        columns=excluded.columns,
+        description=excluded.description,
+        tags=excluded.tags
+"""
+
+# validate_api_key results: key -> (active, expires_at on time.monotonic())
+_KEY_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_KEY_CACHE_LOCK = threading.Lock()
+_KEY_TTL = 60
+_KEY_CACHE_MAX = 4096
+
+# usage_logs rows waiting for the writer thread, which inserts them in batches
+_WRITE_QUEUE: "queue.Queue" = queue.Queue(maxsize=50000)
+_WRITER: Optional[threading.Thread] = None
+_STOP = object()
+_LOG_BATCH_SIZE = 500
+_LOG_RETRIES = 3
+_LOG_RETRY_DELAY = 0.5
+# rows lost to a full queue or a batch that could not be written
+_LOG_DROPPED = {"queue_full": 0, "write_failed": 0}
+_LOG_DROPPED_LOCK = threading.Lock()
 
 # ---------------------------
 # JSON helpers
 # ---------------------------
+def _json_dumps(obj: Any, indent: bool = False) -> bytes:
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode("utf-8")
+
+
+def _json_loads(data):
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def ensure_json_exists():
     if not os.path.exists(DB_JSON):
-        with open(DB_JSON, "w", encoding="utf-8") as f:
-            json.dump([], f, indent=2)
+        with open(DB_JSON, "wb") as f:
+            f.write(_json_dumps([], indent=True))
+
+
+def _stat_key(st: os.stat_result) -> tuple:
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
 
 
 def read_json() -> List[Dict[str, Any]]:
+    with _JSON_LOCK:
+        data = _read_json_cached()
+        _resync_sqlite(data)
+        return data
+
+
+def _read_json_cached() -> List[Dict[str, Any]]:
+    # reparses only when the file changed; a change made outside write_json leaves
+    # SQLite (which backs /get, /latest, /stats and /search) stale until resynced
     ensure_json_exists()
-    with open(DB_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with _JSON_LOCK:
+        st = os.stat(DB_JSON)
+        if _stat_key(st) == _JSON_CACHE["stat"]:
+            return _JSON_CACHE["data"]
+        with open(DB_JSON, "rb") as f:
+            if orjson and st.st_size >= _MMAP_MIN_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as buf:
+                        data = orjson.loads(buf)
+            else:
+                data = _json_loads(f.read())
+        _JSON_CACHE["data"] = data
+        _JSON_CACHE["index"] = {it.get("id"): i for i, it in enumerate(data)}
+        _JSON_CACHE["raw_bytes"] = None
+        _JSON_CACHE["latest"] = {}
+        _JSON_CACHE["stat"] = _stat_key(st)
+        _mark_sqlite_stale()
+        return data
 
 
-def write_json(data: List[Dict[str, Any]]):
-    with open(DB_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def write_json(data: List[Dict[str, Any]], index: Optional[Dict[str, int]] = None):
+    with _JSON_LOCK:
+        # write a temp file and rename it over datasets.json so readers never see a partial file
+        tmp = DB_JSON + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_json_dumps(data, indent=True))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, DB_JSON)
+        # only publish to the cache once the new file is in place
+        if index is None:
+            index = {it.get("id"): i for i, it in enumerate(data)}
+        _JSON_CACHE["index"] = index
+        _JSON_CACHE["data"] = data
+        _JSON_CACHE["raw_bytes"] = None
+        _JSON_CACHE["latest"] = {}
+        _JSON_CACHE["stat"] = _stat_key(os.stat(DB_JSON))
 
 
 # ---------------------------
 # SQLITE Setup & sync
 # ---------------------------
-def init_sqlite():
-    conn = sqlite3.connect(DB_SQLITE)
-    c = conn.cursor()
+def init_sqlite() -> sqlite3.Connection:
+    global _CONN
+    with _DB_LOCK:
+        if _CONN is None:
+            conn = sqlite3.connect(
+                DB_SQLITE, check_same_thread=False, isolation_level=None, cached_statements=256
+            )
+            for pragma in _PRAGMAS:
+                conn.execute(pragma)
+            _CONN = conn
+        _create_tables(_CONN)
+    return _CONN
+
+
+def _get_conn() -> sqlite3.Connection:
+    return _CONN if _CONN is not None else init_sqlite()
+
+
+def _read_conn() -> sqlite3.Connection:
+    conn = getattr(_READ_LOCAL, "conn", None)
+    if conn is None:
+        _get_conn()  # make sure the schema exists and the file is in WAL mode
+        conn = sqlite3.connect(DB_SQLITE, isolation_level=None, cached_statements=256)
+        for pragma in _READ_PRAGMAS:
+            conn.execute(pragma)
+        _READ_LOCAL.conn = conn
+    return conn
+
+
+@contextmanager
+def _write_txn():
+    # serialize writers on the shared connection and group statements in one transaction
+    conn = _get_conn()
+    with _DB_LOCK:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            # SQLite may already have rolled back on its own (e.g. SQLITE_FULL / IOERR)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+
+def _create_tables(c: sqlite3.Connection):
     c.execute(
         """
         CREATE TABLE IF NOT EXISTS datasets (
@@ -71,157 +266,369 @@ def init_sqlite():
         )
         """
     )
-    conn.commit()
-    conn.close()
-
-
-def sync_json_to_sqlite():
-    init_sqlite()
-    items = read_json()
-    conn = sqlite3.connect(DB_SQLITE)
-    c = conn.cursor()
-    for item in items:
-        c.execute(
-            """
-            INSERT INTO datasets (id, name, url, updated, rows, columns, description, tags)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET
-                name=excluded.name,
-                url=excluded.url,
-                updated=excluded.updated,
-                rows=excluded.rows,
-                columns=excluded.columns,
-                description=excluded.description,
-                tags=excluded.tags
-            """,
-            (
-                item.get("id"),
-                item.get("name"),
-                item.get("url"),
-                item.get("updated"),
-                item.get("rows"),
-                json.dumps(item.get("columns")) if item.get("columns") is not None else None,
-                item.get("description"),
-                json.dumps(item.get("tags")) if item.get("tags") is not None else None,
-            ),
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS dataset_tags (
+            dataset_id TEXT,
+            tag TEXT,
+            PRIMARY KEY (dataset_id, tag)
         )
-    conn.commit()
-    conn.close()
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tag ON dataset_tags(tag)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_updated ON datasets(updated DESC)")
+    _create_fts(c)
+
+
+def _create_fts(c: sqlite3.Connection):
+    # full-text index over datasets, kept in sync by triggers; LIKE search is used if FTS5 is missing.
+    # It is keyed on datasets' implicit rowid (the PK is TEXT), which VACUUM may renumber, so
+    # rebuild_sqlite_from_json re-runs the FTS 'rebuild' to keep the d.rowid = f.rowid join valid.
+    global _FTS_ENABLED
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='datasets_fts'").fetchone()
+    if not exists:
+        try:
+            c.execute(
+                "CREATE VIRTUAL TABLE datasets_fts USING fts5(id UNINDEXED, name, description, tags, content='datasets', content_rowid='rowid')"
+            )
+        except sqlite3.OperationalError:
+            _FTS_ENABLED = False
+            return
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS datasets_ai AFTER INSERT ON datasets BEGIN
+            INSERT INTO datasets_fts(rowid, id, name, description, tags)
+            VALUES (new.rowid, new.id, new.name, new.description, new.tags);
+        END
+        """
+    )
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS datasets_ad AFTER DELETE ON datasets BEGIN
+            INSERT INTO datasets_fts(datasets_fts, rowid, id, name, description, tags)
+            VALUES ('delete', old.rowid, old.id, old.name, old.description, old.tags);
+        END
+        """
+    )
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS datasets_au AFTER UPDATE ON datasets BEGIN
+            INSERT INTO datasets_fts(datasets_fts, rowid, id, name, description, tags)
+            VALUES ('delete', old.rowid, old.id, old.name, old.description, old.tags);
+            INSERT INTO datasets_fts(rowid, id, name, description, tags)
+            VALUES (new.rowid, new.id, new.name, new.description, new.tags);
+        END
+        """
+    )
+    if not exists:
+        # index rows that were in datasets before the FTS table existed
+        c.execute("INSERT INTO datasets_fts(datasets_fts) VALUES('rebuild')")
+    _FTS_ENABLED = True
+
+
+def _dataset_params(item: Dict[str, Any]) -> tuple:
+    return (
+        item.get("id"),
+        item.get("name"),
+        item.get("url"),
+        item.get("updated"),
+        item.get("rows"),
+        _json_dumps(item.get("columns")).decode() if item.get("columns") is not None else None,
+        item.get("description"),
+        _json_dumps(item.get("tags")).decode() if item.get("tags") is not None else None,
+    )
+
+
+def _tag_params(item: Dict[str, Any]) -> List[tuple]:
+    return [(item.get("id"), t) for t in (item.get("tags") or [])]
+
+
+def upsert_row_sqlite(conn: sqlite3.Connection, item: Dict[str, Any]):
+    conn.execute(SQL_UPSERT_DATASET, _dataset_params(item))
+    conn.execute(SQL_DELETE_TAGS, (item.get("id"),))
+    conn.executemany(SQL_INSERT_TAG, _tag_params(item))
+
+
+def rebuild_sqlite_from_json():
+    # full JSON -> SQLite resync, used at startup to recover from drift; raises on failure
+    with _JSON_LOCK:
+        data = _read_json_cached()
+        _mark_sqlite_stale()
+        _resync_sqlite(data, force=True)
+
+
+def _mark_sqlite_stale():
+    with _JSON_LOCK:
+        _SQLITE_SYNC["stale"] = True
+        _SQLITE_SYNC["retry_at"] = 0.0
+
+
+def _resync_sqlite(data: List[Dict[str, Any]], force: bool = False):
+    # no-op unless SQLite is marked stale; failed attempts back off instead of retrying per request
+    with _JSON_LOCK:
+        if not _SQLITE_SYNC["stale"]:
+            return
+        now = time.monotonic()
+        if not force and now < _SQLITE_SYNC["retry_at"]:
+            return
+        try:
+            _sync_sqlite(data)
+        except Exception:
+            delay = _SQLITE_SYNC["delay"]
+            _SQLITE_SYNC["retry_at"] = now + delay
+            _SQLITE_SYNC["delay"] = min(delay * 2, _SYNC_BACKOFF_MAX)
+            if force:
+                raise
+            if delay == _SYNC_BACKOFF_MIN:
+                logger.exception("resyncing SQLite from %s failed; retrying in %.0fs", DB_JSON, delay)
+            else:
+                logger.warning("resyncing SQLite from %s still failing; retrying in %.0fs", DB_JSON, delay)
+            return
+        _SQLITE_SYNC["stale"] = False
+        _SQLITE_SYNC["delay"] = _SYNC_BACKOFF_MIN
+        _JSON_CACHE["latest"] = {}
+
+
+def _sync_sqlite(items: List[Dict[str, Any]]):
+    rows = [_dataset_params(item) for item in items]
+    tags = [p for item in items for p in _tag_params(item)]
+    ids = {item.get("id") for item in items}
+    with _write_txn() as conn:
+        stale = [(r[0],) for r in conn.execute("SELECT id FROM datasets").fetchall() if r[0] not in ids]
+        conn.executemany(SQL_DELETE_DATASET, stale)
+        conn.executemany(SQL_DELETE_TAGS, stale)
+        conn.executemany(SQL_UPSERT_DATASET, rows)
+        conn.executemany(SQL_DELETE_TAGS, [(item.get("id"),) for item in items])
+        conn.executemany(SQL_INSERT_TAG, tags)
+        if _FTS_ENABLED:
+            conn.execute("INSERT INTO datasets_fts(datasets_fts) VALUES('rebuild')")
 
 
 # ---------------------------
 # UPSERT / CRUD
 # ---------------------------
 def upsert_item(item: Dict[str, Any]):
-    items = read_json()
-    found = False
-    for i, it in enumerate(items):
-        if it.get("id") == item.get("id"):
+    with _JSON_LOCK:
+        # work on copies so a failed write leaves the cached list and index untouched
+        items = list(read_json())
+        index = dict(_JSON_CACHE["index"])
+        i = index.get(item.get("id"))
+        if i is not None:
             items[i] = item
-            found = True
-            break
-    if not found:
-        items.append(item)
-    write_json(items)
-    sync_json_to_sqlite()
+        else:
+            index[item.get("id")] = len(items)
+            items.append(item)
+        write_json(items, index)
+        try:
+            with _write_txn() as conn:
+                upsert_row_sqlite(conn, item)
+        except BaseException:
+            # the JSON already has the item, so let the next read bring SQLite back in line
+            _mark_sqlite_stale()
+            raise
 
 
 def query_all() -> List[Dict[str, Any]]:
     return read_json()
 
 
-def query_latest(limit: int = 1) -> List[Dict[str, Any]]:
-    items = read_json()
-    items_sorted = sorted(items, key=lambda x: x.get("updated") or "", reverse=True)
-    return items_sorted[:limit]
+def query_all_json() -> bytes:
+    # query_all() already encoded as a JSON array, rebuilt only after the file changes
+    with _JSON_LOCK:
+        data = read_json()
+        if _JSON_CACHE["raw_bytes"] is None:
+            _JSON_CACHE["raw_bytes"] = _json_dumps(data)
+        return _JSON_CACHE["raw_bytes"]
+
+
+def _fts_query(keyword: str) -> str:
+    # each whitespace-separated term becomes a quoted prefix match, ANDed together
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in keyword.split())
+
+
+def _row_to_dict(r: tuple) -> Dict[str, Any]:
+    return {
+        "id": r[0],
+        "name": r[1],
+        "url": r[2],
+        "updated": r[3],
+        "rows": r[4],
+        "columns": _json_loads(r[5]) if r[5] else None,
+        "description": r[6],
+        "tags": _json_loads(r[7]) if r[7] else None,
+    }
+
+
+def get_by_id(dataset_id: str) -> Optional[Dict[str, Any]]:
+    read_json()  # stat check; resyncs SQLite if datasets.json was edited externally
+    row = _read_conn().execute(SQL_GET_BY_ID, (dataset_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def query_latest_sql(limit: int = 1) -> List[Dict[str, Any]]:
+    # walks idx_updated from the top, so cost is O(limit) rather than a full sort
+    read_json()
+    rows = _read_conn().execute(SQL_LATEST, (limit,)).fetchall()
+    return [_row_to_dict(r) for r in rows]
+
+
+def query_latest_json(limit: int = 1) -> bytes:
+    # every dataset write goes through write_json, so a JSON file change also invalidates this
+    with _JSON_LOCK:
+        read_json()
+        body = _JSON_CACHE["latest"].get(limit)
+        if body is None:
+            body = _json_dumps(query_latest_sql(limit))
+            _JSON_CACHE["latest"][limit] = body
+        return body
+
+
+def query_stats() -> Dict[str, Any]:
+    read_json()
+    conn = _read_conn()
+    # one read transaction so both queries see the same snapshot
+    conn.execute("BEGIN")
+    try:
+        count, last_updated = conn.execute(SQL_STATS).fetchone()
+        tags = dict(conn.execute(SQL_TAG_COUNTS).fetchall())
+    finally:
+        conn.execute("COMMIT")
+    return {"count": count, "last_updated": last_updated, "tag_counts": tags}
 
 
 def search_sqlite(keyword: str, limit: int = 50) -> List[Dict[str, Any]]:
-    init_sqlite()
-    conn = sqlite3.connect(DB_SQLITE)
-    c = conn.cursor()
-    pattern = f"%{keyword}%"
-    c.execute(
-        "SELECT id,name,url,updated,rows,columns,description,tags FROM datasets WHERE name LIKE ? OR description LIKE ? OR tags LIKE ? LIMIT ?",
-        (pattern, pattern, pattern, limit),
-    )
-    rows = c.fetchall()
-    conn.close()
-    results = []
-    for r in rows:
-        cols = json.loads(r[5]) if r[5] else None
-        tags = json.loads(r[7]) if r[7] else None
-        results.append(
-            {
-                "id": r[0],
-                "name": r[1],
-                "url": r[2],
-                "updated": r[3],
-                "rows": r[4],
-                "columns": cols,
-                "description": r[6],
-                "tags": tags,
-            }
-        )
-    return results
+    read_json()
+    conn = _read_conn()
+    query = _fts_query(keyword)
+    if _FTS_ENABLED and query:
+        rows = conn.execute(SQL_SEARCH, (query, limit)).fetchall()
+    else:
+        pattern = f"%{keyword}%"
+        rows = conn.execute(SQL_SEARCH_LIKE, (pattern, pattern, pattern, limit)).fetchall()
+    return [_row_to_dict(r) for r in rows]
 
 
 # ---------------------------
 # API key management
 # ---------------------------
 def create_api_key(label: Optional[str] = None, quota: Optional[int] = None) -> str:
-    init_sqlite()
-    k = secrets.token_urlsafe(32)
-    now = datetime.datetime.utcnow().isoformat()
-    conn = sqlite3.connect(DB_SQLITE)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO api_keys (key, label, created_at, active, quota) VALUES (?, ?, ?, ?, ?)",
-        (k, label or "", now, 1, quota),
-    )
-    conn.commit()
-    conn.close()
+    # same 43-char urlsafe form as secrets.token_urlsafe(32)
+    k = base64.urlsafe_b64encode(os.urandom(32)).rstrip(b"=").decode()
+    now = time.strftime(_TS_FMT, time.gmtime())
+    with _write_txn() as conn:
+        conn.execute(SQL_CREATE_KEY, (k, label or "", now, 1, quota))
+    _forget_api_key(k)
     return k
 
 
 def validate_api_key(key: Optional[str]) -> bool:
     if not key:
         return False
-    init_sqlite()
-    conn = sqlite3.connect(DB_SQLITE)
-    c = conn.cursor()
-    c.execute("SELECT active FROM api_keys WHERE key = ?", (key,))
-    row = c.fetchone()
-    conn.close()
-    return bool(row and row[0] == 1)
+    now = time.monotonic()
+    with _KEY_CACHE_LOCK:
+        hit = _KEY_CACHE.get(key)
+        if hit and hit[1] > now:
+            _KEY_CACHE.move_to_end(key)
+            return hit[0]
+    row = _read_conn().execute(SQL_VALIDATE, (key,)).fetchone()
+    active = bool(row and row[0] == 1)
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE[key] = (active, now + _KEY_TTL)
+        _KEY_CACHE.move_to_end(key)
+        if len(_KEY_CACHE) > _KEY_CACHE_MAX:
+            _KEY_CACHE.popitem(last=False)
+    return active
+
+
+def _forget_api_key(key: str):
+    with _KEY_CACHE_LOCK:
+        _KEY_CACHE.pop(key, None)
 
 
 def deactivate_api_key(key: str):
-    init_sqlite()
-    conn = sqlite3.connect(DB_SQLITE)
-    c = conn.cursor()
-    c.execute("UPDATE api_keys SET active = 0 WHERE key = ?", (key,))
-    conn.commit()
-    conn.close()
+    with _write_txn() as conn:
+        conn.execute(SQL_DEACTIVATE_KEY, (key,))
+    _forget_api_key(key)
 
 
 # ---------------------------
-# Usage logging (sync + async)
+# Usage logging (single writer thread)
 # ---------------------------
 def log_usage(api_key: str, endpoint: str):
+    # non-blocking; rows are inserted in batches by the writer thread
+    try:
+        _WRITE_QUEUE.put_nowait((api_key, endpoint, int(time.time())))
+    except queue.Full:
+        dropped = _count_dropped("queue_full", 1)
+        if dropped == 1 or dropped % _LOG_BATCH_SIZE == 0:
+            logger.warning("usage log queue full; %d rows dropped so far", dropped)
+
+
+def _count_dropped(reason: str, n: int) -> int:
+    with _LOG_DROPPED_LOCK:
+        _LOG_DROPPED[reason] += n
+        return _LOG_DROPPED[reason]
+
+
+def usage_log_dropped() -> Dict[str, int]:
+    with _LOG_DROPPED_LOCK:
+        return dict(_LOG_DROPPED)
+
+
+def _write_usage_batch(batch: List[tuple]):
+    for attempt in range(_LOG_RETRIES):
+        if attempt:
+            time.sleep(_LOG_RETRY_DELAY)
+        try:
+            with _write_txn() as conn:
+                conn.executemany(SQL_LOG_USAGE, batch)
+            return
+        except sqlite3.Error as e:
+            error = e
+    _count_dropped("write_failed", len(batch))
+    logger.error("dropped %d usage log rows after %d attempts: %s", len(batch), _LOG_RETRIES, error)
+
+
+def _writer():
+    stop = False
+    while not stop:
+        row = _WRITE_QUEUE.get()
+        batch = []
+        while True:
+            if row is _STOP:
+                stop = True
+                break
+            batch.append(row)
+            if len(batch) >= _LOG_BATCH_SIZE:
+                break
+            try:
+                row = _WRITE_QUEUE.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                _write_usage_batch(batch)
+            except Exception:
+                # never let one bad batch kill the only writer
+                _count_dropped("write_failed", len(batch))
+                logger.exception("dropped %d usage log rows", len(batch))
+
+
+def start_writer():
+    global _WRITER
+    if _WRITER is None or not _WRITER.is_alive():
+        _WRITER = threading.Thread(target=_writer, name="usage-log-writer", daemon=True)
+        _WRITER.start()
+
+
+def stop_writer(timeout: float = 5.0):
+    # drain what's queued, then stop the thread
+    global _WRITER
+    if _WRITER is None:
+        return
     try:
-        init_sqlite()
-        ts = int(time.time())
-        conn = sqlite3.connect(DB_SQLITE)
-        c = conn.cursor()
-        c.execute("INSERT INTO usage_logs (api_key, endpoint, ts) VALUES (?, ?, ?)", (api_key, endpoint, ts))
-        conn.commit()
-        conn.close()
-    except Exception:
-        pass
-
-
-async def log_usage_async(api_key: str, endpoint: str):
-    # run sync log in threadpool to avoid blocking
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, log_usage, api_key, endpoint)
+        _WRITE_QUEUE.put(_STOP, timeout=timeout)
+    except queue.Full:
+        return
+    _WRITER.join(timeout)
+    _WRITER = None
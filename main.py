@@ -2,18 +2,23 @@
 import os
 import time
 import json
-import asyncio
-from collections import defaultdict
+from collections import defaultdict, deque
 from typing import List, Optional
 
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 
 from models import DatasetMeta, UpdatePayload
 import dbmanager as db_manager
 
+# orjson-backed responses when available (ORJSONResponse needs the orjson package)
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 # Optional Redis support (only used if REDIS_URL env var is set)
 try:
     import redis.asyncio as aioredis
@@ -27,7 +32,17 @@ REDIS_URL = os.environ.get("REDIS_URL")  # optional
 RATE_LIMIT = int(os.environ.get("RATE_LIMIT", 120))  # requests per window
 RATE_WINDOW = int(os.environ.get("RATE_WINDOW", 60))  # window seconds
 
-app = FastAPI(title="Dataset Cleanser API — Production Pack")
+# fixed-window counter: INCR and set the expiry only on the first hit, in one round trip
+RATE_LUA = """
+local c = redis.call('INCR', KEYS[1])
+if c == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end
+return c
+"""
+
+app = FastAPI(
+    title="Dataset Cleanser API — Production Pack",
+    default_response_class=ORJSONResponse if orjson else JSONResponse,
+)
 
 # CORS - tighten in production
 app.add_middleware(
@@ -49,17 +64,32 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 def startup_event():
     db_manager.ensure_json_exists()
     db_manager.init_sqlite()         # creates tables (datasets, api_keys, usage_logs)
-    db_manager.sync_json_to_sqlite()
+    db_manager.rebuild_sqlite_from_json()
     # Try connecting to Redis if configured
     if REDIS_URL and aioredis:
         try:
             app.state.redis = aioredis.from_url(REDIS_URL)
+            # EVALSHA under the hood, re-loading the script if Redis reports NOSCRIPT
+            app.state.rate_script = app.state.redis.register_script(RATE_LUA)
         except Exception as e:
             app.state.redis = None
     else:
         app.state.redis = None
     # in-memory rate limiter store for non-redis fallback
-    app.state._rate_store = defaultdict(list)
+    app.state._rate_store = defaultdict(deque)
+    app.state._rate_swept = time.time()
+    # single background thread that batches usage_logs inserts
+    db_manager.start_writer()
+    # static pages are served from memory; they only change on deploy
+    app.state.static_pages = {
+        "index": read_static_file(("static", "index.html")),
+        "dashboard": read_static_file(("static", "dashboard.html")),
+    }
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    db_manager.stop_writer()
 
 
 # ------------------------------------------
@@ -68,14 +98,14 @@ def startup_event():
 def read_static_file(path_parts):
     path = os.path.join(os.path.dirname(__file__), *path_parts)
     if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
+        with open(path, "rb") as f:
             return f.read()
     return None
 
 
 @app.get("/", response_class=HTMLResponse)
 def homepage():
-    content = read_static_file(("static", "index.html"))
+    content = app.state.static_pages["index"]
     if content:
         return HTMLResponse(content)
     return HTMLResponse("<h1>Index not found</h1>", status_code=404)
@@ -83,7 +113,7 @@ def homepage():
 
 @app.get("/dashboard", response_class=HTMLResponse)
 def dashboard():
-    content = read_static_file(("static", "dashboard.html"))
+    content = app.state.static_pages["dashboard"]
     if content:
         return HTMLResponse(content)
     return HTMLResponse("<h1>Dashboard not found</h1>", status_code=404)
@@ -105,25 +135,30 @@ def docs_ui():
 # ------------------------------------------
 # Rate limiting (Redis optional; else in-memory)
 # ------------------------------------------
-async def _redis_rate_check(redis_client, key: str) -> bool:
+async def _redis_rate_check(rate_script, key: str) -> bool:
     # Returns True if limited
     try:
-        p = redis_client.pipeline()
-        p.incr(key)
-        p.expire(key, RATE_WINDOW)
-        res = await p.execute()
-        count = int(res[0])
+        count = int(await rate_script(keys=[key], args=[RATE_WINDOW * 1000]))
         return count > RATE_LIMIT
     except Exception:
         return False
 
 
+def _mem_rate_sweep(store, now: float):
+    # drop clients with no hits inside the current window so the store doesn't grow forever
+    for client_id in [cid for cid, hits in store.items() if not hits or hits[-1] <= now - RATE_WINDOW]:
+        del store[client_id]
+
+
 def _mem_rate_check(store, client_id: str) -> bool:
     now = time.time()
+    if now - app.state._rate_swept >= RATE_WINDOW:
+        _mem_rate_sweep(store, now)
+        app.state._rate_swept = now
     hits = store[client_id]
     # purge old
     while hits and hits[0] <= now - RATE_WINDOW:
-        hits.pop(0)
+        hits.popleft()
     if len(hits) >= RATE_LIMIT:
         return True
     hits.append(now)
@@ -145,20 +180,16 @@ async def rate_limit_middleware(request: Request, call_next):
     limited = False
     if redis_client:
         key = f"rate:{client_id}"
-        limited = await _redis_rate_check(redis_client, key)
+        limited = await _redis_rate_check(app.state.rate_script, key)
     else:
         limited = _mem_rate_check(app.state._rate_store, client_id)
 
     if limited:
         return JSONResponse({"detail": "rate limit exceeded"}, status_code=429)
 
-    # log usage if api_key present (async-friendly)
+    # log usage if api_key present (queued for the writer thread, never blocks)
     if api_key:
-        try:
-            # don't block request; schedule background logging
-            asyncio.create_task(db_manager.log_usage_async(api_key, request.url.path))
-        except Exception:
-            pass
+        db_manager.log_usage(api_key, request.url.path)
 
     return await call_next(request)
 
@@ -188,20 +219,17 @@ def status():
         db_manager.init_sqlite()
     except Exception:
         ok = False
-    return {"service": "dataset-cleanser-api", "healthy": ok, "time": int(time.time())}
+    return {
+        "service": "dataset-cleanser-api",
+        "healthy": ok,
+        "time": int(time.time()),
+        "usage_log_dropped": db_manager.usage_log_dropped(),
+    }
 
 
 @app.get("/stats")
 def stats():
-    items = db_manager.query_all()
-    count = len(items)
-    last = db_manager.query_latest(1)
-    last_updated = last[0]["updated"] if last else None
-    tags = {}
-    for it in items:
-        for t in (it.get("tags") or []):
-            tags[t] = tags.get(t, 0) + 1
-    return {"count": count, "last_updated": last_updated, "tag_counts": tags}
+    return db_manager.query_stats()
 
 
 # ------------------------------------------
@@ -209,21 +237,21 @@ def stats():
 # ------------------------------------------
 @app.get("/datasets", response_model=List[DatasetMeta])
 def get_datasets():
-    return db_manager.query_all()
+    # pre-serialized bytes; returning a Response skips response_model validation
+    return Response(db_manager.query_all_json(), media_type="application/json")
 
 
 @app.get("/latest", response_model=List[DatasetMeta])
 def get_latest():
-    return db_manager.query_latest(1)
+    return Response(db_manager.query_latest_json(1), media_type="application/json")
 
 
 @app.get("/get/{dataset_id}")
 def get_dataset(dataset_id: str):
-    items = db_manager.query_all()
-    for it in items:
-        if it.get("id") == dataset_id:
-            return it
-    raise HTTPException(status_code=404, detail="Dataset not found")
+    item = db_manager.get_by_id(dataset_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return item
 
 
 @app.get("/search", response_model=List[DatasetMeta], dependencies=[])
@@ -235,8 +263,8 @@ def search(keyword: str, limit: int = 50):
 @app.post("/update", dependencies=[Depends(require_api_key)])
 def update(payload: UpdatePayload):
     if not payload.updated:
-        payload.updated = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-    item = payload.model_dump() if hasattr(payload, "model_dump") else payload.dict()
+        payload.updated = time.strftime(db_manager._TS_FMT, time.gmtime())
+    item = payload.model_dump(mode="json") if hasattr(payload, "model_dump") else payload.dict()
     db_manager.upsert_item(item)
     return {"status": "ok", "id": item.get("id")}
 